@@ -1,8 +1,16 @@
 import time
-import json
-import requests
-from jose import jwt as jose_jwt, JWTError
-from typing import List, Dict, Any, Optional
+import asyncio
+import orjson
+import binascii
+import os
+import hashlib
+import functools
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple, FrozenSet, NamedTuple
+
+import grpc
 
 # ------------------------------------------------------------------
 # CONFIGURATION
@@ -12,105 +20,400 @@ from typing import List, Dict, Any, Optional
 OIDC_ISSUER = "https://your-idp.example.com"
 JWKS_ENDPOINT = f"{OIDC_ISSUER}/.well-known/jwks.json"
 
-# Cache the JWKS for token verification
-_JWKS_CACHE: Optional[Dict[str, Any]] = None
+# Cache the JWKS for token verification, as (public key, alg) keyed by 'kid'
+_JWKS_BY_KID: Optional[Dict[str, Any]] = None
 _JWKS_LAST_FETCH: float = 0
 JWKS_TTL_SECONDS = 3600  # re-fetch every hour
+JWKS_MIN_REFRESH_SECONDS = 30  # unknown 'kid's can't force refreshes faster than this
+JWKS_FETCH_TIMEOUT = 5
+
+# Refreshes run in a daemon thread; the lock guards the flag/future pair and
+# the Future lets callers that have nothing usable wait for the outcome,
+# from a thread or (via asyncio.wrap_future) from the event loop.
+_JWKS_LOCK = threading.Lock()
+_JWKS_REFRESHING = False
+_JWKS_REFRESH_DONE: Future = Future()
+
+# One keep-alive session for all JWKS fetches (TLS session reuse), plus the
+# last ETag so unchanged key sets come back as a body-less 304.
+_JWKS_SESSION = None
+_JWKS_ETAG: Optional[str] = None
+
+# JWK 'kty' -> (jwt.algorithms class, the one JWS alg accepted for such keys).
+# RS256 stays the default; ES256 (P-256 ECDSA) is far cheaper to verify.
+_KEY_BUILDERS = {
+    "RSA": ("RSAAlgorithm", "RS256"),
+    "EC": ("ECAlgorithm", "ES256"),
+}
+
+# requests (urllib3, chardet, ...) and PyJWT (cryptography) are imported on
+# first use, so processes that never verify a token don't pay for them.
+_jwt = None
+
+def _jwt_lib():
+    global _jwt
+    if _jwt is None:
+        import jwt
+        import jwt.algorithms
+        _jwt = jwt
+    return _jwt
+
+# Cache misses in the asyncio servers (signature math, maybe a first JWKS
+# fetch) run on a small dedicated pool, off the event loop and apart from
+# the default executor that DB/Redis work uses; cryptography drops the GIL
+# inside OpenSSL. Its threads never wait on the IdP: authorize_async()
+# does any JWKS wait on the event loop before submitting, so a junk 'kid'
+# cannot park the (possibly single) verify thread for JWKS_FETCH_TIMEOUT * 2.
+_VERIFY_POOL: Optional[ThreadPoolExecutor] = None
+_VERIFY_POOL_LOCK = threading.Lock()
+_VERIFY_THREAD = threading.local()
+
+def _mark_verify_thread():
+    _VERIFY_THREAD.no_jwks_wait = True
+
+def verify_pool() -> ThreadPoolExecutor:
+    """
+    Shared executor for JWT signature checks (see authorize_async()).
+    """
+    global _VERIFY_POOL
+    if _VERIFY_POOL is None:
+        with _VERIFY_POOL_LOCK:
+            if _VERIFY_POOL is None:
+                # Sized to the cores this process may use: a server worker
+                # pinned to one core gets one verify thread, not one per
+                # host core
+                cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+                _VERIFY_POOL = ThreadPoolExecutor(
+                    max_workers=cpus or 1,
+                    thread_name_prefix="jwt-verify",
+                    initializer=_mark_verify_thread,
+                )
+    return _VERIFY_POOL
+
+def _jwks_session():
+    global _JWKS_SESSION
+    if _JWKS_SESSION is None:
+        import requests
+        from requests.adapters import HTTPAdapter
+        session = requests.Session()
+        session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        _JWKS_SESSION = session
+    return _JWKS_SESSION
+
+# base64url -> standard alphabet, for decoding JWT segments with binascii (C)
+_URLSAFE_TRANS = bytes.maketrans(b"-_", b"+/")
+
+# Recently verified tokens: (blake2b-128(token), audience) -> _Verified.
+# Raw tokens are never stored, failures are never cached, and entries are
+# evicted LRU / lazily on expiry.
+class _FrozenClaims(dict):
+    """
+    Read-only claims dict. Still a dict, so json/orjson serialize it as
+    usual, but every caller shares the cached instance, so in-place
+    changes are refused; copies (dict(claims), copy.copy, deepcopy) are
+    plain, mutable dicts.
+    """
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("verified token claims are read-only")
+
+    __setitem__ = __delitem__ = __ior__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+    def __reduce__(self):
+        return (dict, (dict(self),))
+
+def _freeze(value):
+    # Claims are plain JSON: objects become _FrozenClaims, arrays tuples
+    if isinstance(value, dict):
+        return _FrozenClaims((k, _freeze(v)) for k, v in value.items())
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+class _Verified(NamedTuple):
+    payload: Dict[str, Any]  # a _FrozenClaims, shared by every hit
+    expires_at: float
+    cap_index: Tuple[FrozenSet[str], Tuple[str, ...]]
+    aud_index: Tuple[FrozenSet[str], Tuple[str, ...]]
+
+_VERIFIED_CACHE: "OrderedDict[tuple, _Verified]" = OrderedDict()
+_VERIFIED_CACHE_LOCK = threading.Lock()
+VERIFIED_CACHE_MAXSIZE = 10_000
+VERIFIED_CACHE_EXP_MARGIN = 5  # seconds; stop serving a token this close to 'exp'
+# Upper bound on how long one verification is reused, whatever 'exp' says, so
+# a JWKS key rotation or revocation takes effect within this many seconds.
+# Kept short: it is the window in which a revoked token still skips the
+# signature check. JWT_CACHE_TTL_SECONDS (or the generic CACHE_TTL_SECONDS)
+# overrides it.
+JWT_CACHE_TTL_SECONDS = float(
+    os.getenv("JWT_CACHE_TTL_SECONDS", os.getenv("CACHE_TTL_SECONDS", "10"))
+)
 
 # ------------------------------------------------------------------
 # UTILS: Fetch & Cache JWKS
 # ------------------------------------------------------------------
-def _fetch_jwks() -> Dict[str, Any]:
-    global _JWKS_CACHE, _JWKS_LAST_FETCH
-    now = time.time()
-    if _JWKS_CACHE is None or now - _JWKS_LAST_FETCH > JWKS_TTL_SECONDS:
-        resp = requests.get(JWKS_ENDPOINT, timeout=5)
+def _refresh_jwks(done: Future):
+    """
+    Fetch the JWKS and swap in a freshly built {kid: (key, alg)} map.
+    On failure the previous (stale) keys stay in place.
+    """
+    global _JWKS_BY_KID, _JWKS_LAST_FETCH, _JWKS_REFRESHING, _JWKS_ETAG
+    try:
+        headers = {}
+        if _JWKS_ETAG and _JWKS_BY_KID is not None:
+            headers["If-None-Match"] = _JWKS_ETAG
+        resp = _jwks_session().get(JWKS_ENDPOINT, headers=headers, timeout=JWKS_FETCH_TIMEOUT)
+        if resp.status_code == 304:
+            with _JWKS_LOCK:
+                _JWKS_LAST_FETCH = time.time()
+            return
         resp.raise_for_status()
-        _JWKS_CACHE = resp.json()
-        _JWKS_LAST_FETCH = now
-    return _JWKS_CACHE
+        algorithms = _jwt_lib().algorithms
+        keys = {}
+        for jwk in orjson.loads(resp.content).get("keys", []):
+            builder = _KEY_BUILDERS.get(jwk.get("kty"))
+            if builder is None or not jwk.get("kid"):
+                continue
+            cls_name, alg = builder
+            if jwk.get("alg", alg) != alg or (alg == "ES256" and jwk.get("crv") != "P-256"):
+                continue
+            keys[jwk["kid"]] = (getattr(algorithms, cls_name).from_jwk(jwk), alg)
+        with _JWKS_LOCK:
+            _JWKS_BY_KID = keys
+            _JWKS_LAST_FETCH = time.time()
+            _JWKS_ETAG = resp.headers.get("ETag")
+    except Exception as e:
+        print(f"[auth] JWKS refresh failed: {e}")
+    finally:
+        with _JWKS_LOCK:
+            _JWKS_REFRESHING = False
+        done.set_result(None)
+
+def _start_jwks_refresh() -> Future:
+    """
+    Kick off a background refresh unless one is already running.
+    Returns the Future that resolves when the in-flight refresh finishes.
+    """
+    global _JWKS_REFRESHING, _JWKS_REFRESH_DONE
+    with _JWKS_LOCK:
+        if not _JWKS_REFRESHING:
+            _JWKS_REFRESHING = True
+            _JWKS_REFRESH_DONE = Future()
+            threading.Thread(
+                target=_refresh_jwks, args=(_JWKS_REFRESH_DONE,), daemon=True
+            ).start()
+        return _JWKS_REFRESH_DONE
+
+def _wait_for_jwks_refresh():
+    """
+    Wait (at most JWKS_FETCH_TIMEOUT * 2) for a shared refresh. A no-op on
+    verify_pool() threads, where authorize_async() has already waited for
+    it on the event loop.
+    """
+    if getattr(_VERIFY_THREAD, "no_jwks_wait", False):
+        return
+    try:
+        _start_jwks_refresh().result(JWKS_FETCH_TIMEOUT * 2)
+    except FutureTimeout:
+        pass
+
+async def _jwks_refreshed():
+    """
+    _wait_for_jwks_refresh() for the event loop: no thread is held while
+    the IdP answers. shield() keeps a cancelled RPC from cancelling the
+    refresh Future other waiters share.
+    """
+    done = asyncio.wrap_future(_start_jwks_refresh())
+    try:
+        await asyncio.wait_for(asyncio.shield(done), JWKS_FETCH_TIMEOUT * 2)
+    except asyncio.TimeoutError:
+        pass
+
+def _jwks_refresh_needed(kid: str) -> bool:
+    # The conditions under which _fetch_jwks()/_signing_key() would wait
+    keys = _JWKS_BY_KID
+    if keys is None:
+        return True
+    return kid not in keys and time.time() - _JWKS_LAST_FETCH > JWKS_MIN_REFRESH_SECONDS
+
+def _fetch_jwks() -> Dict[str, Any]:
+    """
+    Returns {kid: (public_key, alg)}. Keys are constructed once per fetch, so the
+    per-request path is a dict lookup rather than a JWK -> key rebuild.
+
+    Stale-while-revalidate: once keys are loaded, an expired TTL schedules a
+    background refresh and the current keys are served immediately. Only
+    the very first call blocks on the network.
+    """
+    keys = _JWKS_BY_KID
+    if keys is None:
+        _wait_for_jwks_refresh()
+        keys = _JWKS_BY_KID
+        if keys is None:
+            raise _jwt_lib().InvalidTokenError("JWKS unavailable from " + JWKS_ENDPOINT)
+    elif time.time() - _JWKS_LAST_FETCH > JWKS_TTL_SECONDS:
+        _start_jwks_refresh()
+    return keys
+
+def _signing_key(kid: str):
+    """
+    O(1) lookup of the (public key, alg) pair for `kid`. On a miss the JWKS may have
+    rotated, so wait for one (shared) refresh before giving up. Misses
+    within JWKS_MIN_REFRESH_SECONDS of the last fetch fail fast, so junk
+    'kid's cannot hammer the IdP.
+    """
+    key = _fetch_jwks().get(kid)
+    if key is None:
+        if time.time() - _JWKS_LAST_FETCH > JWKS_MIN_REFRESH_SECONDS:
+            _wait_for_jwks_refresh()
+            key = (_JWKS_BY_KID or {}).get(kid)
+        if key is None:
+            raise _jwt_lib().InvalidTokenError("Unable to find matching JWK for kid: " + kid)
+    return key
 
 # ------------------------------------------------------------------
-# VERIFY OIDC JWT (RS256)
+# VERIFY OIDC JWT (RS256 / ES256)
 # ------------------------------------------------------------------
 def verify_jwt_token(token: str, audience: str) -> Dict[str, Any]:
     """
-    Verify an RS256 JWT against the identity provider’s JWKS.
+    Verify an RS256 or ES256 JWT against the identity provider’s JWKS.
     Checks signature, 'exp', 'iat', 'aud', and 'iss'.
-    Returns the decoded payload.
-    Raises JWTError on invalid signature or claims.
+    Returns the decoded payload, read-only (arrays come back as tuples).
+    Raises jwt.InvalidTokenError on invalid signature or claims.
+
+    Successfully verified tokens are cached for JWT_CACHE_TTL_SECONDS (never
+    past shortly before 'exp'), so a bearer token reused across many RPCs
+    only pays for signature verification about once per TTL. The payload
+    is frozen once when cached and shared, uncopied, by every hit.
     """
-    jwks = _fetch_jwks()
-    unverified_header = jose_jwt.get_unverified_header(token)
-    kid = unverified_header.get("kid")
-    if not kid:
-        raise JWTError("Missing 'kid' in token header")
-
-    # Find matching JWK
-    key_data = None
-    for jwk in jwks.get("keys", []):
-        if jwk.get("kid") == kid:
-            key_data = jwk
-            break
-    if key_data is None:
-        # Possibly the JWKS rotated; force re-fetch once
-        _JWKS_LAST_FETCH = 0
-        jwks = _fetch_jwks()
-        for jwk in jwks.get("keys", []):
-            if jwk.get("kid") == kid:
-                key_data = jwk
-                break
-        if key_data is None:
-            raise JWTError("Unable to find matching JWK for kid: " + kid)
-
-    # Use jose to decode & verify
+    return _verify(token, audience).payload
+
+def _verify(token: str, audience: str) -> _Verified:
+    cache_key = _verified_cache_key(token, audience)
+    now = time.time()
+    entry = _cached_entry(cache_key, now)
+    if entry is not None:
+        return entry
+
+    payload = _freeze(_decode_and_verify(token, audience))
+    entry = _Verified(
+        payload,
+        min(payload["exp"] - VERIFIED_CACHE_EXP_MARGIN, now + JWT_CACHE_TTL_SECONDS),
+        build_cap_index(payload),
+        _build_aud_index(payload),
+    )
+    with _VERIFIED_CACHE_LOCK:
+        _VERIFIED_CACHE[cache_key] = entry
+        if len(_VERIFIED_CACHE) > VERIFIED_CACHE_MAXSIZE:
+            _VERIFIED_CACHE.popitem(last=False)
+    return entry
+
+# A hit skips signature verification, so the key hash must be collision
+# resistant: with a non-cryptographic hash (xxh3, ...) a forged token could
+# be crafted to collide with a cached one. BLAKE2b-128 costs ~2 us for a
+# typical token; callers compute it once per check.
+def _verified_cache_key(token: str, audience: str) -> tuple:
+    return (hashlib.blake2b(token.encode(), digest_size=16).digest(), audience)
+
+def _cached_entry(cache_key: tuple, now: float) -> Optional[_Verified]:
+    with _VERIFIED_CACHE_LOCK:
+        hit = _VERIFIED_CACHE.get(cache_key)
+        if hit is not None:
+            if hit.expires_at > now:
+                _VERIFIED_CACHE.move_to_end(cache_key)
+                return hit
+            del _VERIFIED_CACHE[cache_key]
+    return None
+
+def _b64url_decode(seg: bytes) -> bytes:
+    seg = seg.translate(_URLSAFE_TRANS)
+    return binascii.a2b_base64(seg + b"=" * (-len(seg) % 4))
+
+def _token_kid(token: str) -> str:
+    # Parse the header ourselves (once) instead of get_unverified_header(),
+    # which would repeat the base64/JSON work that decode() does anyway.
     try:
-        payload = jose_jwt.decode(
-            token,
-            key_data,
-            algorithms=["RS256"],
-            audience=audience,
-            issuer=OIDC_ISSUER,
-        )
-        return payload
-    except JWTError as e:
-        raise
+        header = orjson.loads(_b64url_decode(token.split(".", 1)[0].encode("ascii")))
+    except (ValueError, TypeError) as e:
+        raise _jwt_lib().InvalidTokenError(f"Malformed token header: {e}")
+    kid = header.get("kid") if isinstance(header, dict) else None
+    if not kid:
+        raise _jwt_lib().InvalidTokenError("Missing 'kid' in token header")
+    return kid
+
+def _decode_and_verify(token: str, audience: str) -> Dict[str, Any]:
+    jwt = _jwt_lib()
+    kid = _token_kid(token)
+
+    # Each key is only accepted with its own algorithm, so ES256 tokens
+    # never touch the RSA path (and vice versa).
+    key, alg = _signing_key(kid)
+
+    # PyJWT + cryptography: signature math runs in OpenSSL, and all
+    # mandatory claims are enforced in the same decode pass.
+    return jwt.decode(
+        token,
+        key=key,
+        algorithms=[alg],
+        audience=audience,
+        issuer=OIDC_ISSUER,
+        options={
+            "require": ["exp", "iat", "aud", "iss", "sub"],
+            "verify_aud": True,
+            "verify_iss": True,
+        },
+    )
 
 # ------------------------------------------------------------------
 # CHECK CAPABILITY / AUDIENCE / DELEGATION
 # ------------------------------------------------------------------
+# Claim indexes are memoized on the claim's entries (tokens for the same
+# principal share them) rather than stored on the payload, so payloads stay
+# plain, serializable claim dicts.
+@functools.lru_cache(maxsize=4096)
+def _split_patterns(entries: tuple) -> Tuple[FrozenSet[str], Tuple[str, ...]]:
+    """
+    Split claim entries into (exact, prefixes), where prefixes are the
+    wildcard entries with their trailing '*' removed, longest first so the
+    most specific grant is tried first.
+    """
+    exact = frozenset(entries)
+    prefixes = tuple(sorted(
+        (e[:-1] for e in entries if isinstance(e, str) and e.endswith("*")),
+        key=len,
+        reverse=True,
+    ))
+    return exact, prefixes
+
+def build_cap_index(payload: Dict[str, Any]) -> Tuple[FrozenSet[str], Tuple[str, ...]]:
+    """
+    Returns (exact, prefixes) for payload["capabilities"]. The verified-token
+    cache keeps both the capability and audience indexes next to each
+    payload, so authorize() never re-classifies wildcards.
+    """
+    return _split_patterns(tuple(payload.get("capabilities") or ()))
+
+def _build_aud_index(payload: Dict[str, Any]) -> Tuple[FrozenSet[str], Tuple[str, ...]]:
+    """
+    Same as build_cap_index(), for the 'aud' claim (string or list).
+    """
+    aud_claim = payload.get("aud")
+    return _split_patterns((aud_claim,) if isinstance(aud_claim, str) else tuple(aud_claim or ()))
+
 def has_capability(payload: Dict[str, Any], required: str) -> bool:
     """
     Returns True if 'required' matches any entry in payload["capabilities"].
     Supports exact match and wildcard suffix (e.g., "db:inventory:*").
     """
-    caps = payload.get("capabilities", [])
-    for cap in caps:
-        if cap == required:
-            return True
-        if cap.endswith("*"):
-            prefix = cap[:-1]
-            if required.startswith(prefix):
-                return True
-    return False
+    exact, prefixes = build_cap_index(payload)
+    return required in exact or required.startswith(prefixes)
 
 def has_audience(payload: Dict[str, Any], target: str) -> bool:
     """
     Checks if payload["aud"] (which may be string or list) matches `target` or its wildcard.
     """
-    aud_claim = payload.get("aud")
-    if isinstance(aud_claim, str):
-        audiences = [aud_claim]
-    else:
-        audiences = list(aud_claim or [])
-    for aud in audiences:
-        if aud == target:
-            return True
-        if isinstance(aud, str) and aud.endswith("*"):
-            prefix = aud[:-1]
-            if target.startswith(prefix):
-                return True
-    return False
+    exact, prefixes = _build_aud_index(payload)
+    return target in exact or target.startswith(prefixes)
 
 def verify_delegation_proof(
     delegation_jwt: str,
@@ -119,33 +422,117 @@ def verify_delegation_proof(
 ) -> Dict[str, Any]:
     """
     Verifies that `delegation_jwt`:
-      1. Is a valid RS256 JWT issued by the same IdP (issuer matches OIDC_ISSUER).
+      1. Is a valid RS256/ES256 JWT issued by the same IdP (issuer matches OIDC_ISSUER,
+         enforced at decode time together with exp/iat/aud/sub presence).
       2. Has 'sub' equal to original_token_payload['sub'] (i.e., original subject).
       3. Has 'delegatee' == delegatee (the server name calling this function).
       4. Its 'capabilities' is a subset of original_token_payload['capabilities'].
       5. Its 'aud' properly targets this delegatee.
 
+    `original_token_payload` must itself come from verify_jwt_token().
     Returns the decoded delegation payload.
-    Raises JWTError or ValueError on any check failure.
+    Raises jwt.InvalidTokenError or ValueError on any check failure.
     """
     # 1. Decode & verify signature + claims (audience = delegatee)
     payload = verify_jwt_token(delegation_jwt, audience=delegatee)
 
-    # 2. Confirm same issuer and subject
-    if payload.get("iss") != original_token_payload.get("iss"):
-        raise ValueError("Delegation proof 'iss' does not match original token issuer")
-    if payload.get("sub") != original_token_payload.get("sub"):
-        raise ValueError("Delegation proof 'sub' must match original token 'sub'")
-
-    # 3. Check delegatee
-    if payload.get("delegatee") != delegatee:
+    # 2 & 3. Same subject, and addressed to this delegatee. 'iss' (and the
+    #        presence of 'sub') is already enforced by jwt.decode for both
+    #        tokens, so only the cross-token claims are compared here: one
+    #        tuple compare on the happy path, diagnosed only on failure.
+    got = (payload["sub"], payload.get("delegatee"))
+    want = (original_token_payload.get("sub"), delegatee)
+    if got != want:
+        if got[0] != want[0]:
+            raise ValueError("Delegation proof 'sub' must match original token 'sub'")
         raise ValueError(f"Delegation proof not intended for this server ({delegatee})")
 
-    # 4. Check capability subset
-    orig_caps = set(original_token_payload.get("capabilities", []))
-    del_caps = set(payload.get("capabilities", []))
+    # 4. Check capability subset (the exact-match frozensets of both
+    #    cap indexes, built once per verified token and reused here)
+    orig_caps = build_cap_index(original_token_payload)[0]
+    del_caps = build_cap_index(payload)[0]
     if not del_caps.issubset(orig_caps):
         raise ValueError("Delegated capabilities exceed original token’s capabilities")
 
     # 5. Audience check already done in verify_jwt_token
     return payload
+
+# ------------------------------------------------------------------
+# Combined authorization for servicer handlers
+# ------------------------------------------------------------------
+class AuthResult(NamedTuple):
+    payload: Optional[Dict[str, Any]]
+    status_code: Optional[grpc.StatusCode]  # None when authorized
+    message: str
+
+def authorize(
+    token: str,
+    audience: str,
+    required_cap: str,
+    delegation_proof: str = ""
+) -> AuthResult:
+    """
+    verify_jwt_token() + capability check (falling back to a delegation
+    proof addressed to `audience`, if given) + audience check in one call.
+    Never raises: on failure returns (None, status_code, message) ready for
+    context.abort(); on success (payload, None, "") with the read-only
+    payload from verify_jwt_token().
+    """
+    return _authorize(None, token, audience, required_cap, delegation_proof)
+
+def _authorize(entry, token, audience, required_cap, delegation_proof) -> AuthResult:
+    # `entry`, if given, is the cached verification of `token`
+    try:
+        if entry is None:
+            entry = _verify(token, audience)
+        payload = entry.payload
+        aud_index = entry.aud_index
+        exact, prefixes = entry.cap_index
+        if not (required_cap in exact or required_cap.startswith(prefixes)):
+            if not delegation_proof:
+                return AuthResult(None, grpc.StatusCode.PERMISSION_DENIED, f"Token lacks {required_cap}")
+            payload = verify_delegation_proof(
+                delegation_proof, delegatee=audience, original_token_payload=payload
+            )
+            if required_cap not in build_cap_index(payload)[0]:
+                return AuthResult(None, grpc.StatusCode.PERMISSION_DENIED, f"Delegation proof lacks {required_cap}")
+            aud_index = _build_aud_index(payload)
+        exact, prefixes = aud_index
+        if not (audience in exact or audience.startswith(prefixes)):
+            return AuthResult(None, grpc.StatusCode.PERMISSION_DENIED, f"Token not for {audience}")
+    except Exception as e:
+        return AuthResult(None, grpc.StatusCode.UNAUTHENTICATED, f"Auth failed: {e}")
+    return AuthResult(payload, None, "")
+
+async def authorize_async(
+    token: str,
+    audience: str,
+    required_cap: str,
+    delegation_proof: str = ""
+) -> AuthResult:
+    """
+    authorize() for asyncio handlers. When every token involved is already
+    in the verified cache (the common case) the check runs inline; otherwise
+    it runs on verify_pool() so a signature check never blocks the event
+    loop. A JWKS refresh the check would wait for is awaited here first,
+    so pool threads only ever do signature math.
+    """
+    now = time.time()
+    entry = _cached_entry(_verified_cache_key(token, audience), now)
+    if entry is not None and (
+        not delegation_proof
+        or _cached_entry(_verified_cache_key(delegation_proof, audience), now) is not None
+    ):
+        return _authorize(entry, token, audience, required_cap, delegation_proof)
+    for t in (token, delegation_proof):
+        if not t:
+            continue
+        try:
+            kid = _token_kid(t)
+        except Exception:
+            continue  # malformed: authorize() reports it
+        if _jwks_refresh_needed(kid):
+            await _jwks_refreshed()
+    return await asyncio.get_running_loop().run_in_executor(
+        verify_pool(), authorize, token, audience, required_cap, delegation_proof
+    )
@@ -1,174 +1,180 @@
 import os
 import time
-from concurrent import futures
+import asyncio
 
 import grpc
-import redis
-import json
+import grpc.aio
+import redis.asyncio as aioredis
+from google.protobuf.message import DecodeError
 
 import mcp2_pb2 as pb2
 import mcp2_pb2_grpc as pb2_grpc
 
-from auth import verify_jwt_token, has_capability, has_audience
-from middleware import TelemetryLogger
+from auth import authorize_async
+from middleware import (
+    TelemetryLogger, make_batch_publisher, make_subscriber_client, PubSubPoller,
+    default_worker_count, run_server_processes, load_server_credentials
+)
 
 # ------------------------------------------------------------------
 # CONFIGURATION
 # ------------------------------------------------------------------
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/2")
-redis_client = redis.Redis.from_url(REDIS_URL)
+REDIS_MAX_CONNECTIONS = 32
+# Commands (INCR) share one pre-sized pool; a burst waits up to 2 s for a
+# free connection instead of opening new sockets without bound.
+redis_client = aioredis.Redis(connection_pool=aioredis.BlockingConnectionPool.from_url(
+    REDIS_URL, max_connections=REDIS_MAX_CONNECTIONS, timeout=2.0,
+    socket_keepalive=True, socket_timeout=2.0, health_check_interval=30
+))
+# Pub/sub streams and the batch publisher use their own connections, never
+# the command pool (see middleware.make_subscriber_client / make_batch_publisher)
+subscriber_client = make_subscriber_client(REDIS_URL)
+TELEMETRY = TelemetryLogger()
+PUBLISHER = make_batch_publisher(REDIS_URL, telemetry=TELEMETRY)
 
 TLS_CERT_DIR = os.getenv("CERTS_DIR", "certs")
-SERVER_CERT_FILE = os.path.join(TLS_CERT_DIR, "server.crt")
-SERVER_KEY_FILE = os.path.join(TLS_CERT_DIR, "server.key")
-CA_CERT_FILE = os.path.join(TLS_CERT_DIR, "ca.crt")
+
+# Server processes sharing port 50052 (default 1)
+SERVER_WORKERS = default_worker_count("EVENTBUS_WORKERS")
 
 SERVER_NAME = "EventBusServer"
-TELEMETRY = TelemetryLogger()
 
-# Tracks sequence IDs per topic (in-memory; consider Redis hash for persistence)
-TOPIC_COUNTER = {}
+# Per-topic sequence counters live in Redis (atomic INCR, shared by every
+# EventBus instance and persistent across restarts)
+TOPIC_SEQ_PREFIX = "mcp2:seq:"
+
+# ------------------------------------------------------------------
+# Hot-path aliases (see context_tool_server.py)
+# ------------------------------------------------------------------
+_INTERNAL = grpc.StatusCode.INTERNAL
+_log = TELEMETRY.log
+_now = time.time
+_EventPublishResponse = pb2.EventPublishResponse
+_EventEnvelope = pb2.EventEnvelope
 
 # ------------------------------------------------------------------
 # EventBus Service
 # ------------------------------------------------------------------
 class EventBusServicer(pb2_grpc.EventBusServicer):
-    def Publish(self, request, context):
-        start_time = time.time()
-        peer = context.peer()
-
-        try:
-            payload = verify_jwt_token(request.publisher_token, audience=SERVER_NAME)
-            required_cap = f"event:publish:{request.topic}"
-            if not has_capability(payload, required_cap):
-                prefix = request.topic.split(":")[0]
-                wildcard = f"event:publish:{prefix}*"
-                if not has_capability(payload, wildcard):
-                    context.abort(grpc.StatusCode.PERMISSION_DENIED, f"Token lacks event:publish:{request.topic}")
-            if not has_audience(payload, SERVER_NAME):
-                context.abort(grpc.StatusCode.PERMISSION_DENIED, f"Token not for {SERVER_NAME}")
-
-        except Exception as e:
-            TELEMETRY.log({
+    async def Publish(self, request, context):
+        start_time = _now()
+
+        # Wildcard grants such as "event:publish:inventory:*" are matched by
+        # the prefix index built when the token was verified, so one check
+        # covers both exact and wildcard capabilities.
+        auth = await authorize_async(request.publisher_token, SERVER_NAME, f"event:publish:{request.topic}")
+        if auth.status_code is not None:
+            _log({
                 "method": "Publish",
-                "client": peer,
-                "latency_ms": int((time.time() - start_time) * 1000),
-                "status": f"unauthenticated: {e}"
+                "client": context.peer(),
+                "latency_ms": int((_now() - start_time) * 1000),
+                "status": f"denied: {auth.message}"
             })
-            context.abort(grpc.StatusCode.UNAUTHENTICATED, f"Auth failed: {e}")
+            await context.abort(auth.status_code, auth.message)
+        payload = auth.payload
 
-        seq = TOPIC_COUNTER.get(request.topic, 0) + 1
-        TOPIC_COUNTER[request.topic] = seq
+        seq = await redis_client.incr(TOPIC_SEQ_PREFIX + request.topic)
 
         channel = f"mcp2:event:{request.topic}"
-        message = json.dumps({
-            "topic": request.topic,
-            "payload": request.payload.decode("utf-8", errors="ignore"),
-            "sequence_id": seq,
-            "timestamp": time.time()
-        }).encode("utf-8")
-        redis_client.publish(channel, message)
-
-        TELEMETRY.log({
+        # Redis carries the serialized EventEnvelope itself, so subscribers
+        # forward it without a JSON round-trip (and binary payloads survive).
+        message = _EventEnvelope(
+            topic=request.topic,
+            payload=request.payload,
+            sequence_id=seq
+        ).SerializeToString()
+        # Best-effort: the response means "accepted and queued". A Redis
+        # failure after this point drops the event (see BatchPublisher).
+        PUBLISHER.publish(channel, message)
+
+        _log({
             "method": "Publish",
             "client": payload["sub"],
             "topic": request.topic,
-            "latency_ms": int((time.time() - start_time) * 1000),
+            "latency_ms": int((_now() - start_time) * 1000),
             "status": "success"
         })
-        return pb2.EventPublishResponse(success=True, message="Published")
+        return _EventPublishResponse(success=True, message="Queued")
 
-    def Subscribe(self, request, context):
-        start_time = time.time()
-        peer = context.peer()
+    async def Subscribe(self, request, context):
+        start_time = _now()
 
-        try:
-            payload = verify_jwt_token(request.subscriber_token, audience=SERVER_NAME)
-            required_cap = f"event:subscribe:{request.topic_filter}"
-            if not has_capability(payload, required_cap):
-                prefix = request.topic_filter.split(":")[0]
-                wildcard = f"event:subscribe:{prefix}*"
-                if not has_capability(payload, wildcard):
-                    context.abort(grpc.StatusCode.PERMISSION_DENIED, f"Token lacks event:subscribe:{request.topic_filter}")
-            if not has_audience(payload, SERVER_NAME):
-                context.abort(grpc.StatusCode.PERMISSION_DENIED, f"Token not for {SERVER_NAME}")
-        except Exception as e:
-            TELEMETRY.log({
+        auth = await authorize_async(request.subscriber_token, SERVER_NAME, f"event:subscribe:{request.topic_filter}")
+        if auth.status_code is not None:
+            _log({
                 "method": "Subscribe",
-                "client": peer,
-                "latency_ms": int((time.time() - start_time) * 1000),
-                "status": f"unauthenticated: {e}"
+                "client": context.peer(),
+                "latency_ms": int((_now() - start_time) * 1000),
+                "status": f"denied: {auth.message}"
             })
-            context.abort(grpc.StatusCode.UNAUTHENTICATED, f"Auth failed: {e}")
+            await context.abort(auth.status_code, auth.message)
+        payload = auth.payload
 
         if request.topic_filter.endswith("*"):
             prefix = request.topic_filter[:-1]
             pattern = f"mcp2:event:{prefix}*"
-            pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
-            pubsub.psubscribe(pattern)
+            pubsub = subscriber_client.pubsub(ignore_subscribe_messages=True)
+            await pubsub.psubscribe(pattern)
         else:
             channel = f"mcp2:event:{request.topic_filter}"
-            pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
-            pubsub.subscribe(channel)
+            pubsub = subscriber_client.pubsub(ignore_subscribe_messages=True)
+            await pubsub.subscribe(channel)
 
-        TELEMETRY.log({
+        _log({
             "method": "Subscribe.start",
             "client": payload["sub"],
             "topic_filter": request.topic_filter,
-            "latency_ms": int((time.time() - start_time) * 1000),
+            "latency_ms": int((_now() - start_time) * 1000),
             "status": "subscribed"
         })
 
+        from_string = pb2.EventEnvelope.FromString
+        poll = PubSubPoller(pubsub).get
+        write = context.write
         try:
-            for message in pubsub.listen():
-                if not context.is_active():
-                    break
+            while not context.cancelled():
+                message = await poll()
+                if message is None:
+                    continue
                 data = message.get("data")
                 if isinstance(data, bytes):
                     try:
-                        obj = json.loads(data)
-                        envelope = pb2.EventEnvelope(
-                            topic=obj.get("topic", ""),
-                            payload=obj.get("payload", "").encode("utf-8"),
-                            sequence_id=int(obj.get("sequence_id", 0))
-                        )
-                        context.write(envelope)
-                    except Exception:
+                        envelope = from_string(data)
+                    except DecodeError:
                         continue
+                    await write(envelope)
+        except grpc.aio.AbortError:
+            raise
         except Exception as e:
-            TELEMETRY.log({
+            _log({
                 "method": "Subscribe",
                 "client": payload["sub"],
-                "latency_ms": int((time.time() - start_time) * 1000),
+                "latency_ms": int((_now() - start_time) * 1000),
                 "status": f"failure: {e}"
             })
-            context.abort(grpc.StatusCode.INTERNAL, f"Subscribe error: {e}")
+            await context.abort(_INTERNAL, f"Subscribe error: {e}")
         finally:
-            pubsub.close()
+            await pubsub.close()
 
 # ------------------------------------------------------------------
-# Server Bootstrap (mTLS)
+# Server Bootstrap (mTLS, asyncio)
 # ------------------------------------------------------------------
-def serve_event_bus():
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
+async def serve_event_bus(worker_id: int = 0):
+    # grpc.aio: each Subscribe stream is a coroutine rather than a pinned
+    # worker thread, so idle subscribers cost almost nothing.
+    # Each worker process binds the same port (SO_REUSEPORT).
+    server = grpc.aio.server(options=[("grpc.so_reuseport", 1)])
     pb2_grpc.add_EventBusServicer_to_server(EventBusServicer(), server)
 
-    with open(SERVER_CERT_FILE, "rb") as f:
-        server_cert = f.read()
-    with open(SERVER_KEY_FILE, "rb") as f:
-        server_key = f.read()
-    with open(CA_CERT_FILE, "rb") as f:
-        ca_cert = f.read()
-
-    server_credentials = grpc.ssl_server_credentials(
-        [(server_key, server_cert)],
-        root_certificates=ca_cert,
-        require_client_auth=True
-    )
+    server_credentials = load_server_credentials(TLS_CERT_DIR)
     server.add_secure_port("[::]:50052", server_credentials)
-    print(f"[EventBus] (mTLS) Listening on 50052")
-    server.start()
-    server.wait_for_termination()
+    print(f"[EventBus] (mTLS) worker {worker_id} listening on 50052")
+    await server.start()
+    await server.wait_for_termination()
+
+def run_worker(worker_id: int):
+    asyncio.run(serve_event_bus(worker_id))
 
 if __name__ == "__main__":
-    serve_event_bus()
+    run_server_processes(run_worker, SERVER_WORKERS)
@@ -13,8 +13,11 @@ CREATE DATABASE mcp2db OWNER mcp2user;
 CREATE TABLE context_entries (
     context_key TEXT PRIMARY KEY,
     serialized_value BYTEA NOT NULL,
-    metadata_json TEXT
+    metadata_json JSONB
 );
+-- Existing deployments created with metadata_json TEXT, migrate in place:
+--   ALTER TABLE context_entries
+--     ALTER COLUMN metadata_json TYPE jsonb USING metadata_json::jsonb;
 
 -- 5. Grant privileges
 GRANT ALL PRIVILEGES ON DATABASE mcp2db TO mcp2user;
@@ -1,57 +1,321 @@
+import atexit
+import collections
 import functools
+import multiprocessing
+import os
+import queue
+import sys
+import threading
 import time
-from typing import Any, Callable, Dict
+from typing import Any, Callable, Dict, Hashable
+
+from cachetools import TLRUCache
+import grpc
+import redis
+import redis.asyncio as aioredis
 
 # ------------------------------------------------------------------
 # Telemetry Logger Stub
 # ------------------------------------------------------------------
 class TelemetryLogger:
-    def __init__(self):
-        pass
+    """
+    Non-blocking telemetry sink. log() only appends to a bounded deque; a
+    daemon thread drains it every `flush_interval` seconds, or as soon as a
+    full batch is waiting, and emits each batch with a single write. When
+    the buffer is full the oldest entries are dropped rather than slowing
+    down request handlers.
+    """
+    def __init__(self, maxlen: int = 65536, flush_interval: float = 0.1,
+                 batch_size: int = 1000, stream=None):
+        self.q = collections.deque(maxlen=maxlen)
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.stream = stream or sys.stderr
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._drain, name="telemetry-flush", daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
 
     def log(self, entry: Dict[str, Any]):
         """
         A simple telemetry log. In production, send to a monitoring system.
         """
-        print(f"[Telemetry] {time.strftime('%Y-%m-%d %H:%M:%S')} | {entry}")
+        q = self.q
+        q.append((time.time_ns(), entry))
+        if len(q) >= self.batch_size and not self._wake.is_set():
+            self._wake.set()
+
+    def flush(self):
+        """
+        Write out everything currently buffered, in batches.
+        """
+        q = self.q
+        with self._flush_lock:
+            while q:
+                batch = []
+                popleft = q.popleft
+                try:
+                    while len(batch) < self.batch_size:
+                        batch.append(popleft())
+                except IndexError:
+                    pass
+                self.stream.write("".join(
+                    f"[Telemetry] {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(ts // 1_000_000_000))} | {entry!r}\n"
+                    for ts, entry in batch
+                ))
+            self.stream.flush()
+
+    def _drain(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            if self.q:
+                try:
+                    self.flush()
+                except Exception:
+                    pass
+
+# ------------------------------------------------------------------
+# Batched Redis Publisher
+# ------------------------------------------------------------------
+class BatchPublisher:
+    """
+    Coalesces Redis PUBLISHes from many request threads into pipelined
+    batches: a daemon thread flushes after `max_batch` messages or
+    `max_delay` seconds, whichever comes first, so N publishes cost one
+    round-trip. Pass sync=True to publish() when the caller needs the
+    subscriber count back.
+
+    Delivery is best-effort: publish() returns once the message is queued,
+    and a batch whose pipeline fails is dropped. Drops are counted in
+    `dropped` and reported through `telemetry` (a TelemetryLogger), if given.
+    """
+    def __init__(self, redis_client, max_batch: int = 64, max_delay: float = 0.005,
+                 telemetry: "TelemetryLogger" = None):
+        self.redis = redis_client
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.telemetry = telemetry
+        self.dropped = 0
+        self.q: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="redis-publish", daemon=True)
+        self._thread.start()
+
+    def publish(self, channel: str, payload: bytes, sync: bool = False):
+        if sync:
+            return self.redis.publish(channel, payload)
+        self.q.put((channel, payload))
+
+    def _run(self):
+        q = self.q
+        while True:
+            batch = [q.get()]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(q.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                pipe = self.redis.pipeline(transaction=False)
+                for channel, payload in batch:
+                    pipe.publish(channel, payload)
+                pipe.execute()
+            except Exception as e:
+                self.dropped += len(batch)
+                entry = {
+                    "method": "BatchPublisher.publish",
+                    "dropped": len(batch),
+                    "dropped_total": self.dropped,
+                    "status": f"failure: {e}"
+                }
+                if self.telemetry is not None:
+                    self.telemetry.log(entry)
+                else:
+                    print(f"[BatchPublisher] {entry!r}")
+
+def make_batch_publisher(url: str, telemetry: "TelemetryLogger" = None) -> BatchPublisher:
+    """
+    BatchPublisher over its own small synchronous pool (it publishes from
+    one thread), with keepalive and a bounded response timeout.
+    """
+    return BatchPublisher(redis.Redis(connection_pool=redis.ConnectionPool.from_url(
+        url, max_connections=4, socket_keepalive=True, socket_timeout=2.0,
+        health_check_interval=30
+    )), telemetry=telemetry)
+
+def make_subscriber_client(url: str) -> aioredis.Redis:
+    """
+    Async client for pub/sub streams, kept apart from any command pool:
+    each pubsub holds a connection for the life of its stream (it would
+    starve the pool), and idle streams must not trip a socket timeout.
+    """
+    return aioredis.Redis.from_url(url, socket_keepalive=True, health_check_interval=30)
+
+# Subscription loops wait at most SUBSCRIBE_POLL_SECONDS per message, so
+# a quiet topic still re-checks context.cancelled() and a departed client's
+# coroutine and pub/sub connection are released promptly; every N idle
+# polls they also ping the pub/sub connection.
+SUBSCRIBE_POLL_SECONDS = 0.5
+PUBSUB_HEALTH_CHECK_POLLS = 60
+
+class PubSubPoller:
+    """
+    Message source for a streaming handler's subscribe loop. get() with no
+    timeout is an idle poll (SUBSCRIBE_POLL_SECONDS); after
+    PUBSUB_HEALTH_CHECK_POLLS idle polls in a row it pings the connection.
+    An explicit timeout (e.g. until a batch flush) never counts as idle.
+    """
+    def __init__(self, pubsub):
+        self.pubsub = pubsub
+        self._get_message = pubsub.get_message
+        self._idle_polls = 0
+
+    async def get(self, timeout: float = None):
+        if timeout is not None:
+            message = await self._get_message(timeout=timeout)
+        else:
+            message = await self._get_message(timeout=SUBSCRIBE_POLL_SECONDS)
+            if message is None:
+                self._idle_polls += 1
+                if self._idle_polls >= PUBSUB_HEALTH_CHECK_POLLS:
+                    self._idle_polls = 0
+                    await self.pubsub.check_health()
+                return None
+        if message is not None:
+            self._idle_polls = 0
+        return message
 
 # ------------------------------------------------------------------
 # Caching Middleware Stub
 # ------------------------------------------------------------------
 class SimpleCache:
-    def __init__(self):
-        self.store: Dict[str, Any] = {}
+    """
+    Bounded LRU cache with per-entry expiry (cachetools.TLRUCache).
+    Memory is capped at `maxsize` entries and expired entries are never
+    returned. cachetools caches are not thread-safe (reads may evict), so
+    all access goes through one lock.
+    """
+    def __init__(self, maxsize: int = 10_000, ttl: float = 60):
+        self.ttl = ttl
+        # Values are stored as (value, ttl) so set() can override the TTL
+        self.store = TLRUCache(maxsize=maxsize, ttu=lambda _key, item, now: now + item[1])
+        self._lock = threading.Lock()
 
-    def get(self, key: str):
-        return self.store.get(key)
+    def get(self, key: Hashable):
+        with self._lock:
+            item = self.store.get(key)
+        return None if item is None else item[0]
 
-    def set(self, key: str, value: Any, ttl: int = None):
-        self.store[key] = value
+    def set(self, key: Hashable, value: Any, ttl: int = None):
+        with self._lock:
+            self.store[key] = (value, self.ttl if ttl is None else ttl)
 
 # ------------------------------------------------------------------
 # Circuit Breaker Stub
 # ------------------------------------------------------------------
 class CircuitBreaker:
+    """
+    Thread-safe breaker with a lock-free healthy path: before_call() is a
+    single attribute read while closed, and after_call(True) returns without
+    locking when there is nothing to reset. Only failures and state
+    transitions take the lock.
+    """
     def __init__(self, threshold: int = 5, recovery_time: int = 60):
         self.threshold = threshold
         self.recovery_time = recovery_time
         self.failure_count = 0
-        self.last_failure_time = None
+        self.last_failure_time = 0.0
         self.open = False
+        self._lock = threading.Lock()
 
     def before_call(self) -> bool:
-        if self.open:
-            if time.time() - self.last_failure_time > self.recovery_time:
-                return True
-            return False
-        return True
+        if not self.open:
+            return True
+        return time.monotonic() - self.last_failure_time > self.recovery_time
 
     def after_call(self, success: bool):
         if success:
-            self.failure_count = 0
-            self.open = False
+            if not self.open and self.failure_count == 0:
+                return
+            with self._lock:
+                self.failure_count = 0
+                self.open = False
         else:
-            self.failure_count += 1
-            self.last_failure_time = time.time()
-            if self.failure_count >= self.threshold:
-                self.open = True
+            with self._lock:
+                self.failure_count += 1
+                # Stamp the time before opening so an unlocked before_call()
+                # never pairs open=True with a stale timestamp
+                self.last_failure_time = time.monotonic()
+                if self.failure_count >= self.threshold:
+                    self.open = True
+
+# ------------------------------------------------------------------
+# mTLS server credentials
+# ------------------------------------------------------------------
+@functools.lru_cache(maxsize=None)
+def load_server_credentials(cert_dir: str) -> grpc.ServerCredentials:
+    """
+    mTLS server credentials from server.crt / server.key / ca.crt in
+    `cert_dir`, requiring client certificates. Read and built once per
+    process and directory.
+    """
+    with open(os.path.join(cert_dir, "server.crt"), "rb") as f:
+        server_cert = f.read()
+    with open(os.path.join(cert_dir, "server.key"), "rb") as f:
+        server_key = f.read()
+    with open(os.path.join(cert_dir, "ca.crt"), "rb") as f:
+        ca_cert = f.read()
+    return grpc.ssl_server_credentials(
+        [(server_key, server_cert)],
+        root_certificates=ca_cert,
+        require_client_auth=True
+    )
+
+# ------------------------------------------------------------------
+# Multi-process launcher (SO_REUSEPORT)
+# ------------------------------------------------------------------
+def default_worker_count(env_var: str) -> int:
+    """
+    Number of server processes: `env_var` if set, else 1. Every process
+    has its own DB pool, executors and Redis pools, so scaling out is
+    opt-in.
+    """
+    return max(1, int(os.environ.get(env_var, "1")))
+
+def _pinned_worker(target: Callable[[int], Any], worker_id: int, cpus):
+    if cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, {cpus[worker_id % len(cpus)]})
+    target(worker_id)
+
+def run_server_processes(target: Callable[[int], Any], workers: int):
+    """
+    Run `target(worker_id)` in `workers` spawned processes, each pinned to
+    one core. The servers bind the same port with grpc.so_reuseport, so the
+    kernel spreads incoming connections across their accept queues. Spawn
+    (not fork) gives every process its own Redis pools, DB engine and
+    background threads. Blocks until all workers exit.
+
+    With a single worker, `target(0)` simply runs in this process, unpinned.
+    """
+    if workers <= 1:
+        target(0)
+        return
+    cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else None
+    ctx = multiprocessing.get_context("spawn")
+    procs = [
+        ctx.Process(target=_pinned_worker, args=(target, i, cpus), name=f"server-{i}")
+        for i in range(workers)
+    ]
+    for p in procs:
+        p.start()
+    try:
+        for p in procs:
+            p.join()
+    except KeyboardInterrupt:
+        for p in procs:
+            p.terminate()
@@ -1,27 +1,33 @@
 import os
 import time
-from concurrent import futures
+import functools
+import asyncio
+import orjson
+from cachetools import LRUCache
 
 import grpc
-import redis
-import json
+import grpc.aio
+import redis.asyncio as aioredis
+from redis.exceptions import RedisError
 
 import mcp2_pb2 as pb2
 import mcp2_pb2_grpc as pb2_grpc
 
-from auth import verify_jwt_token, has_capability, has_audience
-from middleware import TelemetryLogger
+from auth import authorize_async, has_audience
+from middleware import TelemetryLogger, load_server_credentials
 
 # ------------------------------------------------------------------
 # CONFIGURATION
 # ------------------------------------------------------------------
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
-REDIS = redis.Redis.from_url(REDIS_URL)
+# One pre-sized pool shared by all handlers; replies come back as str, so
+# names and JSON values need no per-entry .decode().
+REDIS = aioredis.Redis(connection_pool=aioredis.BlockingConnectionPool.from_url(
+    REDIS_URL, max_connections=64, timeout=2.0, decode_responses=True,
+    socket_keepalive=True, socket_timeout=2.0, health_check_interval=30
+))
 
 TLS_CERT_DIR = os.getenv("CERTS_DIR", "certs")
-SERVER_CERT_FILE = os.path.join(TLS_CERT_DIR, "server.crt")
-SERVER_KEY_FILE = os.path.join(TLS_CERT_DIR, "server.key")
-CA_CERT_FILE = os.path.join(TLS_CERT_DIR, "ca.crt")
 
 SERVER_NAME = "RegistryServer"
 
@@ -30,145 +36,339 @@ TELEMETRY = TelemetryLogger()
 # ------------------------------------------------------------------
 # Helper: Redis Keys & Serialization
 # ------------------------------------------------------------------
-def _redis_key_for(server_name: str) -> str:
-    return f"mcp2:registry:{server_name}"
+# Registrations live in one hash (server_name -> JSON). Lookups never scan
+# it: every capability is indexed by a set of server names,
+#   mcp2:cap:<cap>       servers granting <cap> exactly
+#   mcp2:cappfx:<prefix> servers granting "<prefix>*"
+# so a filter's candidates are the SUNION of its exact set and the prefix
+# sets of every prefix of the filter, fetched with one HMGET.
+REGISTRY_HASH = "mcp2:registry"
+# server_name scored by its record's expires_at, so expired registrations
+# can be found without touching the hash
+EXPIRY_ZSET = "mcp2:registry:expiry"
+CAP_INDEX_PREFIX = "mcp2:cap:"
+CAP_PREFIX_INDEX_PREFIX = "mcp2:cappfx:"
 
-def register_in_redis(server_name: str, grpc_url: str, capabilities: list):
-    key = _redis_key_for(server_name)
+# Registrations expire REGISTRATION_TTL seconds after their last Register
+# call; servers must re-register (heartbeat) every REGISTRATION_TTL / 2
+# seconds to stay discoverable. Hash fields can't carry their own TTL on
+# Redis < 7.4, so each record stores 'expires_at' (mirrored in EXPIRY_ZSET):
+# Lookup skips expired records as it meets them, and a sweeper task purges
+# up to REGISTRATION_SWEEP_BATCH of them every REGISTRATION_SWEEP_INTERVAL
+# seconds so servers that went away don't linger in the hash or indexes.
+REGISTRATION_TTL = int(os.getenv("REGISTRATION_TTL", "60"))
+REGISTRATION_SWEEP_INTERVAL = float(os.getenv("REGISTRATION_SWEEP_INTERVAL", "5"))
+REGISTRATION_SWEEP_BATCH = 256
+
+# Deletes a stale record, its expiry entry and its index memberships, but
+# only if the record is still the exact value the caller saw (i.e. nobody
+# re-registered since).
+# KEYS[1] = registry hash, KEYS[2] = expiry zset, KEYS[3..] = index sets;
+# ARGV = name, stale value
+_PURGE_EXPIRED = REDIS.register_script("""
+if redis.call('HGET', KEYS[1], ARGV[1]) == ARGV[2] then
+  redis.call('HDEL', KEYS[1], ARGV[1])
+  redis.call('ZREM', KEYS[2], ARGV[1])
+  for i = 3, #KEYS do redis.call('SREM', KEYS[i], ARGV[1]) end
+  return 1
+end
+return 0
+""")
+
+# Writes a registration and moves its index memberships in one step: SADD
+# to the new index sets, SREM from the ones the previous record had but
+# the new one doesn't. Compare-and-set on the value register_in_redis()
+# read, so a concurrent re-register makes it retry instead of losing keys.
+# KEYS[1] = registry hash, KEYS[2] = expiry zset, KEYS[3..ARGV[4]+2] = new
+# index sets, rest = stale index sets; ARGV = name, previous value ('' if
+# none), new value, number of new index sets, expires_at
+_REGISTER = REDIS.register_script("""
+if (redis.call('HGET', KEYS[1], ARGV[1]) or '') ~= ARGV[2] then
+  return 0
+end
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[3])
+redis.call('ZADD', KEYS[2], ARGV[5], ARGV[1])
+local n = tonumber(ARGV[4])
+for i = 3, n + 2 do redis.call('SADD', KEYS[i], ARGV[1]) end
+for i = n + 3, #KEYS do redis.call('SREM', KEYS[i], ARGV[1]) end
+return 1
+""")
+
+# Decoded records and their ready-made EndpointDescriptors, keyed by
+# (server name, raw hash value). Every Register writes a new value (its
+# expires_at changes), so an entry can't go stale; it just stops being hit
+# and ages out of the LRU. Only the event loop thread touches it.
+RECORD_CACHE_SIZE = 4096
+_RECORDS = LRUCache(maxsize=RECORD_CACHE_SIZE)
+
+def _decode_record(name: str, raw: str):
+    key = (name, raw)
+    record = _RECORDS.get(key)
+    if record is None:
+        data = orjson.loads(raw)
+        record = (data, pb2.EndpointDescriptor(
+            server_name=name,
+            grpc_url=data.get("grpc_url"),
+            capabilities=data.get("capabilities", [])
+        ))
+        _RECORDS[key] = record
+    return record
+
+def _split_capabilities(capabilities):
+    """
+    (exact, prefixes) for a capability list: wildcard entries like "db:*"
+    become the prefix "db:", everything else must match exactly.
+    """
+    exact = [c for c in capabilities if not c.endswith("*")]
+    prefixes = [c[:-1] for c in capabilities if c.endswith("*")]
+    return exact, prefixes
+
+def _index_keys(exact, prefixes) -> list:
+    return [CAP_INDEX_PREFIX + c for c in exact] + [CAP_PREFIX_INDEX_PREFIX + p for p in prefixes]
+
+def _record_index_keys(data: dict) -> list:
+    if "exact" in data:
+        return _index_keys(data["exact"], data["prefixes"])
+    # registered before the match form was stored
+    return _index_keys(*_split_capabilities(data.get("capabilities", [])))
+
+def _matches(data: dict, filters, filter_set: frozenset) -> bool:
+    if "exact" in data:
+        exact, prefixes = data["exact"], data["prefixes"]
+    else:  # registered before the match form was stored
+        exact, prefixes = _split_capabilities(data.get("capabilities", []))
+    # Exact caps: one C-level set probe over the server's list; wildcard
+    # caps: one str.startswith(tuple) per filter, only if it has any
+    if not filter_set.isdisjoint(exact):
+        return True
+    if prefixes:
+        prefixes = tuple(prefixes)
+        return any(f.startswith(prefixes) for f in filters)
+    return False
+
+async def _purge(name: str, raw: str, data: dict):
+    await _PURGE_EXPIRED(
+        keys=[REGISTRY_HASH, EXPIRY_ZSET] + _record_index_keys(data), args=[name, raw]
+    )
+
+async def purge_expired_registrations() -> int:
+    """
+    Purge up to REGISTRATION_SWEEP_BATCH expired registrations, oldest
+    first. Returns how many were removed.
+    """
+    now = time.time()
+    names = await REDIS.zrangebyscore(EXPIRY_ZSET, "-inf", now, start=0, num=REGISTRATION_SWEEP_BATCH)
+    if not names:
+        return 0
+    purged = 0
+    for name, raw in zip(names, await REDIS.hmget(REGISTRY_HASH, names)):
+        if raw is None:  # already purged by a Lookup
+            await REDIS.zrem(EXPIRY_ZSET, name)
+            continue
+        data = orjson.loads(raw)
+        if data.get("expires_at", 0) <= now:
+            await _purge(name, raw, data)
+            purged += 1
+    return purged
+
+async def expiry_sweeper():
+    """
+    Periodic task on the server's event loop; cancelled on shutdown.
+    """
+    while True:
+        await asyncio.sleep(REGISTRATION_SWEEP_INTERVAL)
+        try:
+            purged = await purge_expired_registrations()
+        except RedisError as e:
+            TELEMETRY.log({"method": "expiry_sweeper", "status": f"failure: {e}"})
+            continue
+        if purged:
+            TELEMETRY.log({"method": "expiry_sweeper", "purged": purged, "status": "success"})
+
+async def register_in_redis(server_name: str, grpc_url: str, capabilities):
+    # `capabilities` may be the request's repeated field itself; it is only
+    # copied into a list for serialization
+    exact, prefixes = _split_capabilities(capabilities)
+    expires_at = time.time() + REGISTRATION_TTL
     value = {
         "grpc_url": grpc_url,
-        "capabilities": capabilities,
-        "registered_at": time.time()
+        "capabilities": list(capabilities),
+        # Match form, computed once here rather than on every lookup
+        "exact": exact,
+        "prefixes": prefixes,
+        "expires_at": expires_at
     }
-    REDIS.set(key, json.dumps(value))
+    raw = orjson.dumps(value)
+    index_keys = _index_keys(exact, prefixes)
+    # The script applies atomically, so a concurrent Lookup never sees the
+    # record without its index entries (or vice versa)
+    while True:
+        previous = await REDIS.hget(REGISTRY_HASH, server_name)
+        stale = []
+        if previous is not None:
+            keep = set(index_keys)
+            stale = [k for k in _record_index_keys(orjson.loads(previous)) if k not in keep]
+        if await _REGISTER(
+            keys=[REGISTRY_HASH, EXPIRY_ZSET] + index_keys + stale,
+            args=[server_name, previous or "", raw, len(index_keys), expires_at]
+        ):
+            return
+
+async def lookup_in_redis(filters, allowed=None):
+    # `filters` may be the request's repeated field, iterated in place.
+    # The set form is prepared once per call, not once per candidate server.
+    # `allowed(name)`, if given, drops candidates before their records are
+    # fetched or decoded.
+    if not filters:
+        return []
+    filter_set = frozenset(filters)
+    index_keys = set()
+    for f in filters:
+        index_keys.add(CAP_INDEX_PREFIX + f)
+        index_keys.update(CAP_PREFIX_INDEX_PREFIX + f[:i] for i in range(len(f) + 1))
+    names = await REDIS.sunion(list(index_keys))
+    names = [n for n in names if allowed(n)] if allowed is not None else list(names)
+    if not names:
+        return []
 
-def lookup_in_redis(cap_filters):
     out = []
-    for key in REDIS.scan_iter(match="mcp2:registry:*"):
-        server_name = key.decode().split(":", 2)[-1]
-        data = json.loads(REDIS.get(key))
-        caps = data.get("capabilities", [])
-        for cap_filter in cap_filters:
-            for cap in caps:
-                if cap == cap_filter or (cap.endswith("*") and cap_filter.startswith(cap[:-1])):
-                    out.append({
-                        "server_name": server_name,
-                        "grpc_url": data.get("grpc_url"),
-                        "capabilities": caps
-                    })
-                    break
-            else:
-                continue
-            break
+    now = time.time()
+    for name, raw in zip(names, await REDIS.hmget(REGISTRY_HASH, names)):
+        if raw is None:
+            continue
+        data, descriptor = _decode_record(name, raw)
+        if data.get("expires_at", 0) <= now:
+            await _purge(name, raw, data)
+            continue
+        # The index only nominates candidates; the record has the final say
+        # (a server may have re-registered with different capabilities)
+        if _matches(data, filters, filter_set):
+            out.append(descriptor)
     return out
 
 # ------------------------------------------------------------------
 # Discovery Servicer
 # ------------------------------------------------------------------
+def _reject(context, method: str, client: str, start_ns: int, code, message: str):
+    """
+    Log a refused call and set its status. Expected refusals (bad token,
+    missing metadata) are returned, not raised via context.abort().
+    """
+    TELEMETRY.log({
+        "method": method,
+        "client": client,
+        "latency_ms": (time.monotonic_ns() - start_ns) // 1_000_000,
+        "status": f"denied: {message}"
+    })
+    context.set_code(code)
+    context.set_details(message)
+
 class DiscoveryServicer(pb2_grpc.DiscoveryServicer):
-    def Register(self, request, context):
-        start_time = time.time()
-        peer = context.peer()
+    async def Register(self, request, context):
+        start_ns = time.monotonic_ns()
+
+        # Only two keys are needed: scan the metadata tuples once instead of
+        # building a dict of all of them
+        token = grpc_url = None
+        for key, value in context.invocation_metadata():
+            if key == "registration_token":
+                token = value
+            elif key == "grpc-url":
+                grpc_url = value
 
-        md = dict(context.invocation_metadata())
-        token = md.get("registration_token")
         if not token:
-            context.abort(grpc.StatusCode.UNAUTHENTICATED, "Missing registration_token")
+            code, message = grpc.StatusCode.UNAUTHENTICATED, "Missing registration_token"
+        else:
+            auth = await authorize_async(token, SERVER_NAME, "registry:register")
+            code, message = auth.status_code, auth.message
+            if code is None and not grpc_url:
+                code, message = grpc.StatusCode.INVALID_ARGUMENT, "Missing 'grpc-url'"
+        if code is not None:
+            _reject(context, "Register", context.peer(), start_ns, code, message)
+            return pb2.RegisterResponse(success=False, message=message)
+        payload = auth.payload
 
         try:
-            payload = verify_jwt_token(token, audience=SERVER_NAME)
-            if not has_capability(payload, "registry:register"):
-                context.abort(grpc.StatusCode.PERMISSION_DENIED, "Token lacks registry:register")
-
-            grpc_url = md.get("grpc-url")
-            if not grpc_url:
-                context.abort(grpc.StatusCode.INVALID_ARGUMENT, "Missing 'grpc-url'")
-
-            register_in_redis(request.server_name, grpc_url, list(request.capabilities))
-
+            await register_in_redis(request.server_name, grpc_url, request.capabilities)
+        except RedisError as e:
             TELEMETRY.log({
                 "method": "Register",
                 "client": payload["sub"],
-                "server_name": request.server_name,
-                "latency_ms": int((time.time() - start_time) * 1000),
-                "status": "success"
-            })
-            return pb2.RegisterResponse(success=True, message="Registered successfully")
-
-        except Exception as e:
-            TELEMETRY.log({
-                "method": "Register",
-                "client": peer,
-                "latency_ms": int((time.time() - start_time) * 1000),
+                "latency_ms": (time.monotonic_ns() - start_ns) // 1_000_000,
                 "status": f"failure: {e}"
             })
-            context.abort(grpc.StatusCode.UNAUTHENTICATED, f"Registration failed: {e}")
+            context.set_code(grpc.StatusCode.UNAVAILABLE)
+            context.set_details(f"Registration failed: {e}")
+            return pb2.RegisterResponse(success=False, message="Registration failed")
+
+        TELEMETRY.log({
+            "method": "Register",
+            "client": payload["sub"],
+            "server_name": request.server_name,
+            "latency_ms": (time.monotonic_ns() - start_ns) // 1_000_000,
+            "status": "success"
+        })
+        return pb2.RegisterResponse(success=True, message="Registered successfully")
 
-    def Lookup(self, request, context):
-        start_time = time.time()
-        peer = context.peer()
+    async def Lookup(self, request, context):
+        start_ns = time.monotonic_ns()
 
         token = request.requester_token
         if not token:
-            context.abort(grpc.StatusCode.UNAUTHENTICATED, "Missing requester_token")
+            _reject(context, "Lookup", context.peer(), start_ns,
+                    grpc.StatusCode.UNAUTHENTICATED, "Missing requester_token")
+            return pb2.LookupResponse()
+        auth = await authorize_async(token, SERVER_NAME, "registry:lookup")
+        if auth.status_code is not None:
+            _reject(context, "Lookup", context.peer(), start_ns, auth.status_code, auth.message)
+            return pb2.LookupResponse()
+        payload = auth.payload
 
         try:
-            payload = verify_jwt_token(token, audience=SERVER_NAME)
-            if not has_capability(payload, "registry:lookup"):
-                context.abort(grpc.StatusCode.PERMISSION_DENIED, "Token lacks registry:lookup")
-
-            matches = lookup_in_redis(list(request.capability_filter))
-            endpoints = []
-            for entry in matches:
-                name = entry["server_name"]
-                if has_audience(payload, name):
-                    endpoints.append(pb2.EndpointDescriptor(
-                        server_name=name,
-                        grpc_url=entry["grpc_url"],
-                        capabilities=entry["capabilities"]
-                    ))
-
+            # Servers outside the token's audience are dropped on name alone.
+            # The descriptors are shared cache entries; LookupResponse copies them.
+            endpoints = await lookup_in_redis(
+                request.capability_filter, functools.partial(has_audience, payload)
+            )
+        except RedisError as e:
             TELEMETRY.log({
                 "method": "Lookup",
                 "client": payload["sub"],
-                "found": len(endpoints),
-                "latency_ms": int((time.time() - start_time) * 1000),
-                "status": "success"
-            })
-            return pb2.LookupResponse(endpoints=endpoints)
-
-        except Exception as e:
-            TELEMETRY.log({
-                "method": "Lookup",
-                "client": peer,
-                "latency_ms": int((time.time() - start_time) * 1000),
+                "latency_ms": (time.monotonic_ns() - start_ns) // 1_000_000,
                 "status": f"failure: {e}"
             })
-            context.abort(grpc.StatusCode.UNAUTHENTICATED, f"Lookup failed: {e}")
+            context.set_code(grpc.StatusCode.UNAVAILABLE)
+            context.set_details(f"Lookup failed: {e}")
+            return pb2.LookupResponse()
+
+        TELEMETRY.log({
+            "method": "Lookup",
+            "client": payload["sub"],
+            "found": len(endpoints),
+            "latency_ms": (time.monotonic_ns() - start_ns) // 1_000_000,
+            "status": "success"
+        })
+        return pb2.LookupResponse(endpoints=endpoints)
 
 # ------------------------------------------------------------------
-# BOOTSTRAP SERVER (mTLS)
+# BOOTSTRAP SERVER (mTLS, asyncio)
 # ------------------------------------------------------------------
-def serve_registry():
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
+async def serve_registry():
+    # grpc.aio: Redis round-trips are awaited instead of each RPC holding
+    # one of a fixed pool of threads.
+    server = grpc.aio.server()
     pb2_grpc.add_DiscoveryServicer_to_server(DiscoveryServicer(), server)
 
-    with open(SERVER_CERT_FILE, "rb") as f:
-        server_cert = f.read()
-    with open(SERVER_KEY_FILE, "rb") as f:
-        server_key = f.read()
-    with open(CA_CERT_FILE, "rb") as f:
-        ca_cert = f.read()
-
-    server_credentials = grpc.ssl_server_credentials(
-        [(server_key, server_cert)],
-        root_certificates=ca_cert,
-        require_client_auth=True
-    )
+    server_credentials = load_server_credentials(TLS_CERT_DIR)
     server.add_secure_port("[::]:50050", server_credentials)
     print(f"[Registry] (mTLS) Listening on 50050")
-    server.start()
-    server.wait_for_termination()
+    await server.start()
+
+    sweeper = asyncio.create_task(expiry_sweeper())
+    try:
+        await server.wait_for_termination()
+    finally:
+        sweeper.cancel()
 
 if __name__ == "__main__":
-    serve_registry()
+    asyncio.run(serve_registry())